@@ -1,17 +1,39 @@
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def format_openapi_json(input_file: str = "openapi.json", output_file: str = "openapi_formatted.json"):
     """
     Load the openapi.json file and format it to be more readable.
-    :param input_file:
+
+    Uses orjson if it is installed, falls back to the stdlib json module otherwise. orjson only supports an indent of
+    two spaces, the stdlib path uses the same indent so the output does not depend on the installed backend.
+
+    :param input_file: path to the openapi.json file
+    :param output_file: path of the formatted output file
     :return:
     """
-    with open(input_file, "r") as file:
-        content = json.load(file)
+    # Both backends parse bytes, read the file in one go instead of letting json.load iterate over it
+    with open(input_file, "rb") as file:
+        raw = file.read()
+
+    if orjson is not None:
+        content = orjson.loads(raw)
+
+        with open(output_file, "wb") as file:
+            file.write(orjson.dumps(content, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+
+    else:
+        content = json.loads(raw)
 
-    with open(output_file, "w") as file:
-        json.dump(content, file, indent=4, sort_keys=True, ensure_ascii=False)
+        # Serialize in one go and write once, json.dump would issue a write call per token
+        out = json.dumps(content, indent=2, sort_keys=True, ensure_ascii=False)
+        with open(output_file, "w", buffering=1 << 20) as file:
+            file.write(out)
 
     print("Done formatting openapi.json to openapi_formatted.json")
 
@@ -1,7 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class WAHAConfig(BaseModel):
+    # Frozen, endpoint functions cache urls built from waha_url. Create a new config to talk to another server.
+    model_config = ConfigDict(frozen=True)
+
     waha_url: str = "http://localhost:3000"
 
 
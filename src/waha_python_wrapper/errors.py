@@ -1,7 +1,13 @@
-from aiohttp import ClientResponse, ContentTypeError
+from aiohttp import ClientResponse
+from multidict import CIMultiDict
 import logging
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 """
 Exceptions for the waha_python_wrapper package.
@@ -10,15 +16,22 @@ Exceptions for the waha_python_wrapper package.
 
 logger = logging.getLogger(__name__)
 
+# Both backends raise a ValueError for bodies that aren't JSON, json.JSONDecodeError and orjson.JSONDecodeError for
+# invalid JSON, UnicodeDecodeError from json.loads for bodies that aren't UTF-8
+_loads = orjson.loads if orjson is not None else json.loads
+
 
 class BaseAPIException(Exception):
     """
     Base exception for the waha_python_wrapper package.
+
+    Only the headers of the response are kept, holding on to the ClientResponse would keep its connection from
+    being reused.
     """
     url: str
     code: int
     expected_code: int
-    resp: ClientResponse
+    headers: CIMultiDict
 
     def __init__(self, *args, url: str, code: int, expected_code: int, resp: ClientResponse):
         """
@@ -28,13 +41,13 @@ class BaseAPIException(Exception):
         :param url: Url of the API request
         :param code: status code of the API request
         :param expected_code: expected status code of the API request according to docs
-        :param resp: response of the API request
+        :param resp: response of the API request, only its headers are stored
         """
         super().__init__(*args)
         self.url = url
         self.code = code
         self.expected_code = expected_code
-        self.resp = resp
+        self.headers = resp.headers.copy()
 
     def __str__(self):
         return f"API request to {self.url} failed with status code {self.code}"
@@ -65,15 +78,14 @@ async def handle_error(resp: ClientResponse, expected_code: int = 200):
     """
     content = None
 
+    # Read the body once and try to parse it, independent of the content type the server claims
     try:
-        content = await resp.json()
-    except ContentTypeError:
-        logger.debug("No JSON response from API")
-    except json.JSONDecodeError:
-        logging.warning(f"API response contained invalid json, url: {resp.url}, status: {resp.status}")
-        pass
+        raw = await resp.read()
+        content = _loads(raw) if raw else None
+    except ValueError:
+        logger.debug(f"No JSON response from API, url: {resp.url}, status: {resp.status}")
     except Exception as e:
-        logging.exception("Unknown error while handling API error", exc_info=e)
+        logger.exception("Unknown error while handling API error", exc_info=e)
 
     if content is None:
         return BaseAPIException(url=str(resp.url),
@@ -1,10 +1,40 @@
-from typing import Callable, List, Dict, Any
+from typing import Callable, Any, Optional, Dict, FrozenSet, Awaitable, Iterable, AsyncIterator, Tuple
 from waha_python_wrapper.errors import handle_error
 import aiohttp
-from waha_python_wrapper.config import WAHAConfig
+from waha_python_wrapper.config import WAHAConfig, cfg as default_cfg
 from enum import Enum
 import re
 from abc import ABC, abstractmethod
+from pydantic import TypeAdapter
+import asyncio
+import functools
+import inspect
+import itertools
+import linecache
+import types
+import weakref
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Shared sessions by event loop and waha_url, a session can only be used in the loop it was created in
+_shared_sessions: Dict[Tuple[asyncio.AbstractEventLoop, str], aiohttp.ClientSession] = {}
+
+# Size of the chunks yielded by streaming endpoints
+_STREAM_CHUNK_SIZE = 1 << 16
+
+# Dumps of frozen params/body instances by (id, kind), entries are dropped when the instance is garbage collected
+_dump_cache: Dict[tuple, Any] = {}
+
+# Types of default values that make an exact cache key for _build_api_call, containers compare equal across types of
+# their items, e.g. (1,) == (True,)
+_SCALAR_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+# Numbers the filenames of the generated api_call sources in linecache
+_source_counter = itertools.count()
+
+# Path params of an endpoint path, the group captures the name of the param (an identifier, as used by format_map)
+_PATH_PARAM_RE = re.compile(r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}')
 
 
 class Model(ABC):
@@ -29,181 +59,249 @@ class Methods(str, Enum):
     PATCH = "PATCH"
 
 
-async def handle_response(resp: aiohttp.ClientResponse, expected_code: int = 200, response_model: Any = None):
+# Lookup of the methods by their name, used to parse the method given to api_endpoint_wrapper
+_METHOD_BY_NAME: Dict[str, Methods] = {m.value: m for m in Methods}
+
+
+async def handle_response(resp: aiohttp.ClientResponse,
+                          expected_code: int = 200,
+                          response_adapter: TypeAdapter = None):
     """
     Check the status code, generate error if one occurred, otherwise parse data and return it.
 
+    :param resp: The response from the API
+    :param expected_code: Expected Return code of the API
+    :param response_adapter: TypeAdapter of the response model, raw body is returned if None
+
+    :raise BaseAPIException: If the request failed without a JSON response
+    :raise APIError: If the request failed with a JSON response
+    :raise ValidationError: If the response could not be validated with the response_adapter
+    """
+    # Success path first, the error is only built when the status does not match
+    if resp.status == expected_code:
+        if response_adapter is None:
+            return await resp.content.read()
+
+        # Parse and validate the raw body in one pass inside pydantic-core
+        return response_adapter.validate_json(await resp.read())
+
+    raise await handle_error(resp=resp, expected_code=expected_code)
+
+
+async def stream_response(resp: aiohttp.ClientResponse,
+                          expected_code: int = 200,
+                          chunk_size: int = _STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Check the status code, raise the error if one occurred, otherwise yield the body in chunks without buffering it.
+
+    :param resp: The response from the API
+    :param expected_code: Expected Return code of the API
+    :param chunk_size: maximum size of the yielded chunks
+
     :raise BaseAPIException: If the request failed without a JSON response
     :raise APIError: If the request failed with a JSON response
-    :raise ValidationError: If the response could not be validated with the response_model
     """
-    if not resp.status != expected_code:
+    if resp.status != expected_code:
         raise await handle_error(resp=resp, expected_code=expected_code)
 
-    if response_model is None:
-        return await resp.content.read()
+    async for chunk in resp.content.iter_chunked(chunk_size):
+        yield chunk
 
-    # Validate against response_model
-    resp_data = response_model.model_validate(await resp.json())
-    return resp_data
 
+def get_default_session(cfg: WAHAConfig) -> aiohttp.ClientSession:
+    """
+    Get the shared aiohttp.ClientSession for the server of cfg, used when the caller does not supply a session.
+
+    The session is created lazily on first use in the running event loop. Reusing it keeps the connections to the
+    WAHA server alive across requests instead of opening a new one per call. Every event loop gets its own session,
+    e.g. for consecutive asyncio.run calls. The session uses the waha_url as base_url.
+
+    Call close_client_session before the loop is closed, e.g. at the end of the coroutine passed to asyncio.run.
+
+    :param cfg: config of the server to get the session for
 
-def populate_path_params(path: str, lookup: Dict[str, str]):
+    :return: shared aiohttp.ClientSession
     """
-    Populate path params in a path string with the given values
+    loop = asyncio.get_running_loop()
+    key = (loop, cfg.waha_url)
+    session = _shared_sessions.get(key)
+
+    # No await between the check and the assignment, so no lock is needed
+    if session is None or session.closed:
+        _drop_stale_sessions()
+
+        # aiohttp requires a trailing slash on base_url
+        session = aiohttp.ClientSession(
+            base_url=cfg.waha_url.rstrip("/") + "/",
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=32, keepalive_timeout=75))
+        _shared_sessions[key] = session
+
+    return session
 
-    :param lookup: parameters including
-    :param path: original path string
 
-    :return: path string with populated path params
+def _drop_stale_sessions():
     """
-    for key, value in lookup.items():
-        filled_key = "{" + key + "}"
-        path = path.replace(f'{filled_key}', value)
+    Forget the shared sessions of event loops that have been closed, they can't be used or closed anymore. The
+    sessions hold a reference to their loop, so both are only released here or in close_client_session.
+    """
+    for key in [key for key in _shared_sessions if key[0].is_closed()]:
+        del _shared_sessions[key]
+
 
-    return path
+async def close_client_session():
+    """
+    Close the shared aiohttp.ClientSessions of all servers in the running event loop. Call this at application
+    shutdown, before the loop is closed, the shared sessions are not closed automatically:
 
+        async def main():
+            try:
+                ...
+            finally:
+                await close_client_session()
 
-async def _request_no_body_no_params(target_url: str,
-                                     response_model: Model,
-                                     expected_code: int,
-                                     method: Methods,
-                                     session: aiohttp.ClientSession = None,
-                                     ):
+        asyncio.run(main())
     """
-    Send Request that does not require a body or parameters
+    loop = asyncio.get_running_loop()
+    sessions = [_shared_sessions.pop(key) for key in [key for key in _shared_sessions if key[0] is loop]]
+    _drop_stale_sessions()
+
+    for session in sessions:
+        await session.close()
 
-    :param target_url: url to send the request to, may contain path parameters
-    :param response_model: model to be used for the response
-    :param expected_code: expected http status code of response
-    :param method: http method to be used
-    :param session: aiohttp.ClientSession to be used for the request
 
-    :return: Instance of ResponseModel or raise an error
+def _cached_dump(model: Model, kind: str, dump: Callable[[], Any]) -> Any:
     """
-    # Make the Request
-    if session is None:
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method=str(method), url=target_url) as resp:
-                return await handle_response(response_model=response_model,
-                                             resp=resp,
-                                             expected_code=expected_code)
-    else:
-        async with session.request(method=str(method), url=target_url) as resp:
-            return await handle_response(response_model=response_model,
-                                         resp=resp,
-                                         expected_code=expected_code)
-
-
-async def _request_body_no_params(target_url: str,
-                                  response_model: Model,
-                                  expected_code: int,
-                                  method: Methods,
-                                  body: Model,
-                                  session: aiohttp.ClientSession = None):
+    Return dump(), cached per model instance for models that opt in with ConfigDict(frozen=True). Fields of frozen
+    instances can't be reassigned, so sending the same params or body again, e.g. in a retry loop, skips the
+    serialization.
+
+    frozen is shallow, a list or dict field can still be changed in place. Such a change is not seen by the cache,
+    the instance is sent as it was dumped first. Create a new instance instead of changing a sent one.
+
+    :param model: params or body instance
+    :param kind: what is dumped, to tell apart different dumps of the same instance
+    :param dump: callable producing the dump of the instance
+
+    :return: dump of the instance
     """
-    Send Request that requires a body but no parameters
+    if not model.model_config.get("frozen", False):
+        return dump()
 
-    :param target_url: url to send the request to, may contain path parameters
-    :param response_model: model to be used for the response
-    :param expected_code: expected http status code of response
-    :param method: http method to be used
-    :param body: json body model to be used for the request
-    :param session: aiohttp.ClientSession to be used for the request
+    key = (id(model), kind)
+    try:
+        return _dump_cache[key]
+    except KeyError:
+        pass
+
+    result = _dump_cache[key] = dump()
+    weakref.finalize(model, _dump_cache.pop, key, None)
+    return result
 
-    :return: Instance of ResponseModel or raise an error
+
+def _dump_params(params: Model) -> dict:
     """
-    # Make the Request
-    if session is None:
-        async with aiohttp.ClientSession() as session:
-            async with session.request(url=target_url,
-                                       json=body.model_dump(by_alias=True),
-                                       method=str(method)) as resp:
-                return await handle_response(response_model=response_model,
-                                             resp=resp,
-                                             expected_code=expected_code)
-    else:
-        async with session.request(url=target_url,
-                                   json=body.model_dump(by_alias=True),
-                                   method=str(method)) as resp:
-            return await handle_response(response_model=response_model,
-                                         resp=resp,
-                                         expected_code=expected_code)
-
-
-async def _request_no_body_params(target_url: str,
-                                  response_model: Model,
-                                  expected_code: int,
-                                  method: Methods,
-                                  params: Model,
-                                  session: aiohttp.ClientSession = None):
+    Dump params by alias for session.request, cached for frozen models.
     """
-    Send Request that requires parameters but no body
+    return _cached_dump(params, "params", lambda: params.model_dump(by_alias=True))
 
-    :param target_url: url to send the request to, may contain path parameters
-    :param response_model: model to be used for the response
-    :param expected_code: expected http status code of response
-    :param method: http method to be used
-    :param params: json parameters model to be used for the request
-    :param session: aiohttp.ClientSession to be used for the request
 
-    :return: Instance of ResponseModel or raise an error
+def _dump_body(body: Model) -> bytes:
     """
-    # Make the Request
-    if session is None:
-        async with aiohttp.ClientSession() as session:
-            async with session.request(url=target_url,
-                                       params=params.model_dump(by_alias=True),
-                                       method=str(method)) as resp:
-                return await handle_response(response_model=response_model,
-                                             resp=resp,
-                                             expected_code=expected_code)
-    else:
-        async with session.request(url=target_url,
-                                   params=params.model_dump(by_alias=True),
-                                   method=str(method)) as resp:
-            return await handle_response(response_model=response_model,
-                                         resp=resp,
-                                         expected_code=expected_code)
-
-
-async def _request_body_params(target_url: str,
-                               response_model: Model,
-                               expected_code: int,
-                               method: Methods,
-                               body: Model,
-                               params: Model,
-                               session: aiohttp.ClientSession = None):
+    Serialize body by alias to json bytes, cached for frozen models. Uses the model's own serializer, so fields of
+    subclasses of the request_model are kept.
     """
-    Send Request that requires parameters and a body
+    return _cached_dump(body, "body", lambda: body.model_dump_json(by_alias=True).encode())
 
-    :param target_url: url to send the request to, may contain path parameters
-    :param response_model: model to be used for the response
-    :param expected_code: expected http status code of response
-    :param method: http method to be used
-    :param body: json body model to be used for the request
-    :param params: json parameters model to be used for the request
-    :param session: aiohttp.ClientSession to be used for the request
 
-    :return: Instance of ResponseModel or raise an error
+def _api_call_source(path: str,
+                     expected_code: int,
+                     method: str,
+                     has_params: bool,
+                     has_body: bool,
+                     has_path_args: bool,
+                     stream: bool) -> str:
     """
-    if session is None:
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method=str(method),
-                                       url=target_url,
-                                       params=params.model_dump(by_alias=True),
-                                       json=body.model_dump(by_alias=True)) as resp:
-                return await handle_response(response_model=response_model,
-                                             resp=resp,
-                                             expected_code=expected_code)
+    Generate the source of the api_call for one endpoint. Branches that only depend on the endpoint are resolved
+    here and the path, method and expected_code are inlined as constants, like dataclasses generate __init__.
+
+    The generated code refers to the names provided by _function_factory in the namespace it is executed in. Like
+    dataclasses, api_call is defined inside a factory function that takes them as arguments, so api_call reads them
+    as closure variables instead of globals and callers can't override them.
+
+    :return: source code defining the function _make_api_call, which returns the async function api_call
+    """
+    lines = []
+    hoisted = ["_get_default_session"]
+
+    # Positional order of the arguments, params and body only exist if the endpoint takes them
+    args = ["cfg"]
+    if has_params:
+        args += ["params=None"]
+    if has_body:
+        args += ["body=None"]
+    args += ["session=None"]
+
+    # Check Path Params, the keys view compares against the frozenset without building a new set
+    if has_path_args:
+        hoisted += ["_path_args"]
+        lines += ["    if kwargs.keys() != _path_args:",
+                  "        raise ValueError(f'Expected path params {set(_path_args)}, got {set(kwargs.keys())}')"]
+
+    request_args = f"method={method!r}, url=target_url"
+
+    # Use the precomputed defaults if no params or body are given
+    if has_params:
+        hoisted += ["_default_params_dump", "_dump_params"]
+        lines += ["    params_dump = _default_params_dump if params is None else _dump_params(params)"]
+        request_args += ", params=params_dump"
+
+    if has_body:
+        hoisted += ["_default_body_data", "_dump_body", "_JSON_HEADERS"]
+        lines += ["    body_data = _default_body_data if body is None else _dump_body(body)"]
+        request_args += ", data=body_data, headers=_JSON_HEADERS"
+
+    # The default session has the waha_url as base_url, it only needs the path relative to it.
+    # The path already is a valid format string, the placeholders are the path params. Its bound format_map methods
+    # are hoisted, so filling it is a single call without an attribute lookup.
+    relative_path = path.lstrip("/")
+    lines += ["    if session is None:",
+              "        session = _get_default_session(cfg)"]
+    if has_path_args:
+        hoisted += ["_relative_format", "_path_format"]
+        lines += ["        target_url = _relative_format(kwargs)",
+                  "    else:",
+                  "        target_url = cfg.waha_url + _path_format(kwargs)"]
     else:
-        async with session.request(url=target_url,
-                                   method=str(method),
-                                   params=params.model_dump(by_alias=True),
-                                   json=body.model_dump(by_alias=True)) as resp:
-            return await handle_response(response_model=response_model,
-                                         resp=resp,
-                                         expected_code=expected_code)
+        hoisted += ["_default_base_url", "_default_target_url"]
+        lines += [f"        target_url = {relative_path!r}",
+                  # Prebuilt url of the default config, the compare keeps other configs correct
+                  "    elif cfg.waha_url == _default_base_url:",
+                  "        target_url = _default_target_url",
+                  "    else:",
+                  f"        target_url = cfg.waha_url + {path!r}"]
+
+    lines += [f"    async with session.request({request_args}) as resp:"]
+
+    # Streaming endpoints keep the response open until the generator is exhausted
+    if stream:
+        hoisted += ["_stream_response"]
+        lines += [f"        async for chunk in _stream_response(resp=resp, expected_code={expected_code!r}):",
+                  "            yield chunk"]
+    else:
+        hoisted += ["_handle_response", "_response_adapter"]
+        lines += [f"        return await _handle_response(resp=resp, expected_code={expected_code!r}, "
+                  "response_adapter=_response_adapter)"]
+
+    if has_path_args:
+        args += ["**kwargs"]
+
+    factory_args = ", ".join(f"{name}={name}" for name in hoisted)
+    lines = ([f"def _make_api_call({factory_args}):",
+              f"    async def api_call({', '.join(args)}):"]
+             + [f"    {line}" for line in lines]
+             + ["    return api_call"])
+
+    return "\n".join(lines) + "\n"
 
 
 def _function_factory(path: str,
@@ -211,224 +309,168 @@ def _function_factory(path: str,
                       expected_code: int,
                       param_defaults: dict,
                       body_defaults: dict,
-                      method: Methods = Methods.POST,
+                      method: str = Methods.POST.value,
                       params_model: Model = None,
                       request_model: Model = None,
-                      cleaned_args: List[str] = None,
+                      cleaned_args: FrozenSet[str] = None,
+                      stream: bool = False,
                       ) -> Callable:
     """
-    Factory function to generate an async callable to make the request. Differentiates the 8 different
-    combinations of params_model, request_model and cleaned_args.
+    Factory function to generate an async callable to make the request. The combination of params_model,
+    request_model and cleaned_args is resolved once here, the callable is generated by _api_call_source and
+    compiled once per endpoint.
 
     :param path: path of the API endpoint, may include path parameters
     :param response_model: model to be used for the response
     :param expected_code: expected http status code of response
     :param param_defaults: param_defaults generated by the parent factory function
     :param body_defaults: body_defaults generated by the parent factory function
-    :param method: http method to be used
+    :param method: http method to be used, plain string e.g. 'GET'
     :param params_model: param_model to be used for the request if any
     :param request_model: request_model to be used for request if any
     :param cleaned_args: path arguments to be used for the request if any are present
+    :param stream: generate an async generator that yields the raw body in chunks instead of reading it at once
     :return:
     """
+    # Defaults are fixed at build time, validate and dump them once instead of on every call
+    # An empty dump, e.g. of a params_model without fields, is passed as None so no query is built for it.
+    default_params_dump = None
+    if params_model is not None:
+        default_params_dump = params_model.model_validate(param_defaults).model_dump(by_alias=True) or None
+
+    # Bodies are serialized straight to json bytes by pydantic-core, the default body is sent as is, keep it serialized
+    default_body_data = None
+    if request_model is not None:
+        body_adapter = TypeAdapter(request_model)
+        default_body_data = body_adapter.dump_json(body_adapter.validate_python(body_defaults), by_alias=True)
+
+    # Building the validator is expensive, do it once per endpoint. TypeAdapter also covers List[...] responses.
+    response_adapter = TypeAdapter(response_model) if response_model is not None else None
+
+    source = _api_call_source(path=path,
+                              expected_code=expected_code,
+                              method=method,
+                              has_params=params_model is not None,
+                              has_body=request_model is not None,
+                              has_path_args=cleaned_args is not None,
+                              stream=stream)
+
+    namespace = {
+        # Module of the generated function, as for functions defined in this file
+        "__name__": __name__,
+        "_path_args": cleaned_args,
+        # Without path params the url only depends on the server, prebuild it for the url of the default config
+        # for calls with a caller supplied session.
+        "_default_base_url": default_cfg.waha_url,
+        "_default_target_url": f'{default_cfg.waha_url}{path}',
+        "_relative_format": path.lstrip("/").format_map,
+        "_path_format": path.format_map,
+        "_default_params_dump": default_params_dump,
+        "_default_body_data": default_body_data,
+        "_response_adapter": response_adapter,
+        "_JSON_HEADERS": _JSON_HEADERS,
+        "_dump_params": _dump_params,
+        "_dump_body": _dump_body,
+        "_get_default_session": get_default_session,
+        "_handle_response": handle_response,
+        "_stream_response": stream_response,
+    }
+
+    # Register the source, so tracebacks through the generated function show its code
+    # The counter keeps the filename unique, endpoints with the same method and path may differ in their models
+    filename = f"<waha {method} {path} #{next(_source_counter)}>"
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    exec(compile(source, filename, "exec"), namespace)
+    api_call = namespace["_make_api_call"]()
+    api_call.__qualname__ = "api_call"
+
+    return_annotation = AsyncIterator[bytes] if stream else response_model
+    api_call.__annotations__ = {"cfg": WAHAConfig}
+    if params_model is not None:
+        api_call.__annotations__["params"] = params_model
+    if request_model is not None:
+        api_call.__annotations__["body"] = request_model
+    api_call.__annotations__["session"] = aiohttp.ClientSession
+    api_call.__annotations__["return"] = return_annotation
+
+    # Public signature of the endpoint, hides the bound helpers and lists the path params in order of the path
+    parameters = [inspect.Parameter("cfg", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=WAHAConfig)]
+    if params_model is not None:
+        parameters.append(inspect.Parameter("params", inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                                            default=None, annotation=Optional[params_model]))
+    if request_model is not None:
+        parameters.append(inspect.Parameter("body", inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                                            default=None, annotation=Optional[request_model]))
+    parameters.append(inspect.Parameter("session", inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                                        default=None, annotation=Optional[aiohttp.ClientSession]))
+    for name in dict.fromkeys(_PATH_PARAM_RE.findall(path)):
+        parameters.append(inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, annotation=str))
+
+    api_call.__signature__ = inspect.Signature(parameters=parameters, return_annotation=return_annotation)
+    api_call.__doc__ = f"DEFAULT DOCSTRING: Simple API endpoint call for {path}"
 
-    # 0, 0, 0
-    if params_model is None and request_model is None and cleaned_args is None:
-        async def api_call(cfg: WAHAConfig,
-                           session: aiohttp.ClientSession = None) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            target_url = f'{cfg.waha_url}{path}'
-
-            return await _request_no_body_no_params(target_url=target_url,
-                                                    response_model=response_model,
-                                                    expected_code=expected_code,
-                                                    method=method,
-                                                    session=session)
-
-    # 0, 0, 1
-    elif params_model is None and request_model is None and cleaned_args is not None:
-        async def api_call(cfg: WAHAConfig,
-                           session: aiohttp.ClientSession = None,
-                           **kwargs) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Check Path Params
-            if set(kwargs.keys()) != set(cleaned_args):
-                raise ValueError(f"Expected path params {cleaned_args}, got {set(kwargs.keys())}")
-
-            target_url = f'{cfg.waha_url}{populate_path_params(path, kwargs)}'
-
-            return await _request_no_body_no_params(target_url=target_url,
-                                                    response_model=response_model,
-                                                    expected_code=expected_code,
-                                                    method=method,
-                                                    session=session)
-
-    # 0, 1, 0
-    elif params_model is None and request_model is not None and cleaned_args is None:
-        async def api_call(cfg: WAHAConfig,
-                           body: request_model = None,
-                           session: aiohttp.ClientSession = None) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Create default body
-            if body is None:
-                body = request_model.model_validate(body_defaults)
-
-            target_url = f'{cfg.waha_url}{path}'
-
-            return await _request_body_no_params(target_url=target_url,
-                                                 response_model=response_model,
-                                                 expected_code=expected_code,
-                                                 method=method,
-                                                 body=body,
-                                                 session=session)
-
-    # 0, 1, 1
-    elif params_model is None and request_model is not None and cleaned_args is not None:
-        async def api_call(cfg: WAHAConfig,
-                           body: request_model = None,
-                           session: aiohttp.ClientSession = None,
-                           **kwargs) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Check Path Params
-            if set(kwargs.keys()) != set(cleaned_args):
-                raise ValueError(f"Expected path params {cleaned_args}, got {set(kwargs.keys())}")
-
-            # Create default body
-            if body is None:
-                body = request_model.model_validate(body_defaults)
-
-            target_url = f'{cfg.waha_url}{populate_path_params(path, kwargs)}'
-
-            return await _request_body_no_params(target_url=target_url,
-                                                 response_model=response_model,
-                                                 expected_code=expected_code,
-                                                 method=method,
-                                                 body=body,
-                                                 session=session)
-
-    # 1, 0, 0
-    elif params_model is not None and request_model is None and cleaned_args is None:
-        async def api_call(cfg: WAHAConfig,
-                           params: params_model = None,
-                           session: aiohttp.ClientSession = None) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Create default params
-            if params is None:
-                params = params_model.model_validate(param_defaults)
-
-            target_url = f'{cfg.waha_url}{path}'
-
-            return await _request_no_body_params(target_url=target_url,
-                                                 response_model=response_model,
-                                                 expected_code=expected_code,
-                                                 method=method,
-                                                 params=params,
-                                                 session=session)
-
-    # 1, 0, 1
-    elif params_model is not None and request_model is None and cleaned_args is not None:
-        async def api_call(cfg: WAHAConfig,
-                           params: params_model = None,
-                           session: aiohttp.ClientSession = None,
-                           **kwargs) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Check Path Params
-            if set(kwargs.keys()) != set(cleaned_args):
-                raise ValueError(f"Expected path params {cleaned_args}, got {set(kwargs.keys())}")
-
-            # Create default params
-            if params is None:
-                params = params_model.model_validate(param_defaults)
-
-            target_url = f'{cfg.waha_url}{populate_path_params(path, kwargs)}'
-
-            return await _request_no_body_params(target_url=target_url,
-                                                 response_model=response_model,
-                                                 expected_code=expected_code,
-                                                 method=method,
-                                                 params=params,
-                                                 session=session)
-
-    # 1, 1, 0
-    elif params_model is not None and request_model is not None and cleaned_args is None:
-        async def api_call(cfg: WAHAConfig,
-                           params: params_model = None,
-                           body: request_model = None,
-                           session: aiohttp.ClientSession = None) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Create default params
-            if params is None:
-                params = params_model.model_validate(param_defaults)
-
-            # Create default body
-            if body is None:
-                body = request_model.model_validate(body_defaults)
-
-            target_url = f'{cfg.waha_url}{path}'
-
-            return await _request_body_params(target_url=target_url,
-                                              response_model=response_model,
-                                              expected_code=expected_code,
-                                              method=method,
-                                              body=body,
-                                              params=params,
-                                              session=session)
-
-    # 1, 1, 1
-    else:
-        assert params_model is not None and request_model is not None and cleaned_args is not None, "Invalid combination of params"
-
-        async def api_call(cfg: WAHAConfig,
-                           params: params_model = None,
-                           body: request_model = None,
-                           session: aiohttp.ClientSession = None,
-                           **kwargs) \
-                -> response_model:
-            f"""
-            DEFAULT DOCSTRING: Simple API endpoint call for {path}
-            """
-            # Check Path Params
-            if set(kwargs.keys()) != set(cleaned_args):
-                raise ValueError(f"Expected path params {cleaned_args}, got {set(kwargs.keys())}")
-
-            # Create default params
-            if params is None:
-                params = params_model.model_validate(param_defaults)
-
-            # Create default body
-            if body is None:
-                body = request_model.model_validate(body_defaults)
-
-            target_url = f'{cfg.waha_url}{populate_path_params(path, kwargs)}'
-
-            return await _request_body_params(target_url=target_url,
-                                              response_model=response_model,
-                                              expected_code=expected_code,
-                                              method=method,
-                                              body=body,
-                                              params=params,
-                                              session=session)
+    return api_call
+
+
+def _defaults_key(defaults: dict) -> FrozenSet[tuple]:
+    """
+    Items of a defaults dict for the cache key of _build_api_call. The type is part of each item, True, 1 and 1.0
+    compare and hash equal but are sent differently.
+    """
+    return frozenset((key, type(value), value) for key, value in defaults.items())
+
+
+def _copy_function(func: Callable) -> Callable:
+    """
+    Copy of a function sharing its code and closure, so attributes set on the copy don't change the original.
+    """
+    copy = types.FunctionType(func.__code__, func.__globals__, func.__name__, func.__defaults__, func.__closure__)
+    copy.__kwdefaults__ = func.__kwdefaults__
+    copy.__qualname__ = func.__qualname__
+    copy.__doc__ = func.__doc__
+    copy.__annotations__ = dict(func.__annotations__)
+    copy.__dict__.update(func.__dict__)
+    return copy
+
+
+@functools.lru_cache(maxsize=256)
+def _build_api_call(path: str,
+                    expected_code: int,
+                    method: str,
+                    docstring: Optional[str],
+                    params_model: Model,
+                    request_model: Model,
+                    response_model: Model,
+                    param_defaults: Iterable[tuple],
+                    body_defaults: Iterable[tuple],
+                    stream: bool) -> Callable:
+    """
+    Build the api_call for the normalized arguments of api_endpoint_wrapper. Cached, so declaring the same endpoint
+    again returns the already built function instead of redoing the regex, the defaults and the TypeAdapter.
+
+    :param param_defaults: (key, type, value) items of the param_defaults dict, see _defaults_key
+    :param body_defaults: (key, type, value) items of the body_defaults dict, see _defaults_key
+
+    :return: function to call the api endpoint
+    """
+    # Extract path params
+    cleaned_args = frozenset(_PATH_PARAM_RE.findall(path)) or None
+
+    api_call = _function_factory(
+        path=path,
+        response_model=response_model,
+        expected_code=expected_code,
+        param_defaults={key: value for key, _, value in param_defaults},
+        body_defaults={key: value for key, _, value in body_defaults},
+        method=method,
+        params_model=params_model,
+        request_model=request_model,
+        cleaned_args=cleaned_args,
+        stream=stream,
+    )
+
+    if docstring is not None:
+        api_call.__doc__ = docstring
 
     return api_call
 
@@ -441,10 +483,14 @@ def api_endpoint_wrapper(path: str,
                          request_model: Model = None,
                          response_model: Model = None,
                          body_defaults: dict = None,
-                         param_defaults: dict = None):
+                         param_defaults: dict = None,
+                         stream: bool = False):
     """
     Wrapper for a plain path api endpoint that generates an async callable to make the request.
 
+    The dumps of params and body instances of models with ConfigDict(frozen=True) are cached per instance. frozen is
+    shallow, changes made in place to list or dict fields of an instance that was already sent are not sent.
+
     Generated function may raise the following errors:
     - BaseAPIException: If the request failed without a JSON response
     - APIError: If the request failed with a JSON response
@@ -465,19 +511,15 @@ def api_endpoint_wrapper(path: str,
     :param method: HTTP Method to be used
     :param docstring: docstring for the generated function
     :param param_defaults: arguments passed to the param_model.model_validate method when the params are None.
-    :param body_defaults: default values for the body model
+        Validated once when the wrapper is built.
+    :param body_defaults: default values for the body model, validated once when the wrapper is built.
+    :param stream: generated function is an async generator yielding the raw body in chunks, e.g. for media
+        downloads. Requires response_model to be None.
 
     :return: function to call the api endpoint
     """
-    # Extract path params
-    pattern = re.compile(r'/{[a-zA-Z]*}/?')
-    path_params = pattern.findall(path)
-    cleaned_args = []
-    for param in path_params:
-        cleaned_args.append(param.replace("/", "").replace("{", "").replace("}", ""))
-
-    if len(cleaned_args) == 0:
-        cleaned_args = None
+    if stream and response_model is not None:
+        raise ValueError("Streaming endpoints return the raw body, response_model must be None")
 
     if param_defaults is None:
         param_defaults = {}
@@ -488,30 +530,57 @@ def api_endpoint_wrapper(path: str,
     if not isinstance(method, Methods):
 
         # Try to parse the method, assuming string.
-        try:
-            parsed_method = Methods(str(method).upper())
-        except ValueError:
+        parsed_method = _METHOD_BY_NAME.get(str(method).upper())
+        if parsed_method is None:
             raise ValueError(f"Method {method} not supported, allowed are {list(Methods.__members__.keys())}")
-        except Exception as e:
-            raise e
 
     # Method of correct type, can be used directly
     else:
         parsed_method = method
 
-    api_call = _function_factory(
-        path=path,
-        response_model=response_model,
-        expected_code=expected_code,
-        param_defaults=param_defaults,
-        body_defaults=body_defaults,
-        method=parsed_method,
-        params_model=params_model,
-        request_model=request_model,
-        cleaned_args=cleaned_args,
-    )
+    # str() of a str mixin Enum gives 'Methods.GET', pass the plain value down to aiohttp
+    method_str = parsed_method.value
 
-    if docstring is not None:
-        api_call.__doc__ = docstring
+    # Only scalar defaults are an exact cache key, build endpoints with other defaults (e.g. lists, tuples or dicts)
+    # without the cache
+    if any(type(value) not in _SCALAR_TYPES for value in (*param_defaults.values(), *body_defaults.values())):
+        return _build_api_call.__wrapped__(path, expected_code, method_str, docstring, params_model, request_model,
+                                           response_model,
+                                           [(key, type(value), value) for key, value in param_defaults.items()],
+                                           [(key, type(value), value) for key, value in body_defaults.items()],
+                                           stream)
 
-    return api_call
+    # Every declaration gets its own function object, setting e.g. __doc__ on one doesn't change the others
+    return _copy_function(_build_api_call(path, expected_code, method_str, docstring, params_model, request_model,
+                                          response_model, _defaults_key(param_defaults), _defaults_key(body_defaults),
+                                          stream))
+
+
+async def call_many(coro_factory: Callable[[Any], Awaitable],
+                    items: Iterable,
+                    *,
+                    concurrency: int = 32) -> list:
+    """
+    Call an endpoint for many items concurrently with bounded parallelism.
+
+    Example: await call_many(lambda name: stop_session(cfg, body=SessionStopRequest(name=name)), names)
+
+    All calls share the default session of their server unless the coro_factory passes its own. If one call fails, the
+    remaining calls are cancelled and the errors are raised as an ExceptionGroup.
+
+    :param coro_factory: callable that returns the coroutine to await for an item
+    :param items: items to call coro_factory with
+    :param concurrency: maximum number of calls in flight at the same time
+
+    :return: results in the order of items
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await coro_factory(item)
+
+    async with asyncio.TaskGroup() as tg:
+        tasks = [tg.create_task(run(item)) for item in items]
+
+    return [task.result() for task in tasks]